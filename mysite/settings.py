@@ -47,12 +47,20 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'mysite.urls'
 
+_template_loaders = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    # production: compile each template only once per process
+    _template_loaders = [('django.template.loaders.cached.Loader', _template_loaders)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': _template_loaders,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -71,6 +79,23 @@ DATABASES = {
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
+# A file for the test database, instead of memory. Needed by polls/test_stress.py.
+TEST_DB_FILE = config('TEST_DB_FILE', default='')
+if TEST_DB_FILE:
+    DATABASES['default']['TEST'] = {'NAME': TEST_DB_FILE}
+
+# Number of SQLite databases to store votes in (see polls/shards.py). 0 to not shard votes.
+POLLS_VOTE_SHARDS = config('POLLS_VOTE_SHARDS', default=0, cast=int)
+for shard in range(POLLS_VOTE_SHARDS):
+    DATABASES[f'votes_{shard}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'votes_{shard}.sqlite3'),
+    }
+    if TEST_DB_FILE:
+        # next to the default test database, so votes are shared by processes too
+        root, ext = os.path.splitext(TEST_DB_FILE)
+        DATABASES[f'votes_{shard}']['TEST'] = {'NAME': f'{root}_votes_{shard}{ext}'}
+DATABASE_ROUTERS = ['polls.shards.VoteShardRouter']
 
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
@@ -104,3 +129,21 @@ USE_TZ = True
 # Static files
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, '/static/')
+
+# Polls
+# Keep vote tallies for recently viewed polls in memory (see polls/tally.py).
+POLLS_TALLY_ENGINE = config('POLLS_TALLY_ENGINE', default=False, cast=bool)
+# Seconds before an in-memory tally is rebuilt, to include votes from other processes.
+POLLS_TALLY_MAX_AGE = config('POLLS_TALLY_MAX_AGE', default=60, cast=int)
+# File for poll results shared by worker processes (see polls/results_cache.py),
+# e.g. /dev/shm/polls-results. Empty to not use it.
+POLLS_RESULTS_CACHE = config('POLLS_RESULTS_CACHE', default='')
+# Seconds that shared results are used, in case votes are changed other than by voting.
+POLLS_RESULTS_CACHE_MAX_AGE = config('POLLS_RESULTS_CACHE_MAX_AGE', default=60, cast=int)
+# File to append a journal of all votes to (see polls/journal.py). Empty for no journal.
+POLLS_VOTE_JOURNAL = config('POLLS_VOTE_JOURNAL', default='')
+POLLS_VOTE_JOURNAL_BATCH = config('POLLS_VOTE_JOURNAL_BATCH', default=100, cast=int)
+# Seconds between writes of buffered journal events.
+POLLS_VOTE_JOURNAL_INTERVAL = config('POLLS_VOTE_JOURNAL_INTERVAL', default=1.0, cast=float)
+# Maximum milliseconds for a worker process to start Django (see polls/test_startup.py).
+STARTUP_TIME_BUDGET_MS = config('STARTUP_TIME_BUDGET_MS', default=1500, cast=int)
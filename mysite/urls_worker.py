@@ -0,0 +1,11 @@
+"""mysite URL routing for mysite.settings_worker, without the admin site."""
+from django.urls import include, path
+from django.views.generic import RedirectView
+import mysite.views as views
+
+urlpatterns = [
+    path('', RedirectView.as_view(url='/polls/'), name='site_index'),
+    path('polls/', include('polls.urls')),
+    path('accounts/', include("django.contrib.auth.urls")),
+    path('signup/', views.signup, name='signup'),
+]
@@ -1,5 +1,22 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from . import results_cache, shards
 
 
 class PollsConfig(AppConfig):
     name = 'polls'
+
+    def ready(self):
+        # tally imports the models, so it cannot be imported before the apps are ready
+        from . import tally
+        # cached results must not outlive a change to the poll's choices
+        choice = self.get_model('Choice')
+        for signal in (post_save, post_delete):
+            signal.connect(results_cache.choice_changed, sender=choice)
+            signal.connect(tally.choice_changed, sender=choice)
+        # delete votes in the vote shards, which a cascade does not reach
+        pre_delete.connect(shards.delete_question_votes, sender=self.get_model('Question'))
+        pre_delete.connect(shards.delete_choice_votes, sender=choice)
+        pre_delete.connect(shards.delete_user_votes, sender=settings.AUTH_USER_MODEL)
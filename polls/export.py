@@ -0,0 +1,81 @@
+"""Stream the votes for a poll as CSV, optionally gzip compressed.
+
+Votes are read with values_list() in chunks ordered by id, so that no
+model objects are created and memory use does not grow with the size
+of the poll.  Each chunk is a separate query, so a slow download does
+not keep a cursor (and on SQLite, a read lock) open while votes are saved.
+"""
+import csv
+import zlib
+
+from . import shards
+from .models import Question, Vote
+
+HEADER = ('vote_id', 'user_id', 'choice_id', 'choice_text')
+# number of rows fetched from the database (and written) at a time
+CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """A file-like object that returns what is written, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+def vote_rows(question: Question, chunk_size=CHUNK_SIZE):
+    """Yield a tuple of field values for each vote for a question.
+
+    Choice text is looked up in a dict, so the query for votes does not
+    need a join.
+    """
+    choice_text = dict(question.choice_set.values_list('id', 'choice_text'))
+    votes = (Vote.objects.using(shards.vote_db(question))
+                         .filter(choice_id__in=list(choice_text))
+                         .order_by('id')
+                         .values_list('id', 'user_id', 'choice_id'))
+    last_id = 0
+    while True:
+        # list() reads the whole chunk and closes the cursor
+        chunk = list(votes.filter(id__gt=last_id)[:chunk_size])
+        for vote_id, user_id, choice_id in chunk:
+            yield (vote_id, user_id, choice_id, choice_text[choice_id])
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def csv_chunks(question: Question, chunk_size=CHUNK_SIZE):
+    """Yield the CSV export of a question as strings of up to chunk_size rows.
+    
+    The first chunk contains only the header, so a client receives
+    something right away even for a very large poll.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(HEADER)
+    lines = []
+    for row in vote_rows(question, chunk_size):
+        lines.append(writer.writerow(row))
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def export_csv(question: Question, compress=False, chunk_size=CHUNK_SIZE):
+    """Yield the CSV export of a question as bytes.
+
+    :param question: the poll question to export votes for
+    :param compress: if True, the output is gzip compressed as it is produced
+    :param chunk_size: number of rows to read and write at a time
+    """
+    chunks = (chunk.encode('utf-8') for chunk in csv_chunks(question, chunk_size))
+    if not compress:
+        yield from chunks
+        return
+    # wbits 16+MAX_WBITS writes a gzip header and trailer
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        # sync flush so each chunk is sent now instead of buffered by zlib
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
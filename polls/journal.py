@@ -0,0 +1,208 @@
+"""Append-only journal of votes.
+
+If settings.POLLS_VOTE_JOURNAL is the path of a file, each vote is
+appended to it as one line of JSON, including the user's previous
+choice, so that the history of votes is kept even though a Vote
+is changed when a user changes their vote:
+
+    {"t": 1697700000.123, "user": 2, "question": 1, "old": 3, "new": 4}
+
+"old" is null for a user's first vote for a question.  "t" and "old"
+are read in the transaction that saves the vote (see Vote.cast), so
+the order of "t" is the order in which votes were saved.
+
+To avoid a disk write for every vote, events are buffered and written
+(and fsync'd) in batches of POLLS_VOTE_JOURNAL_BATCH events, and by a
+background thread every POLLS_VOTE_JOURNAL_INTERVAL seconds.  Buffered
+events are also written when the process exits normally and before it
+forks, so at most the last interval of votes is lost if a process is
+killed.  Use the replay_votes command to check or rebuild votes from
+a journal.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from django.conf import settings
+
+# default number of events to buffer before writing
+BATCH_SIZE = 100
+# default maximum seconds to buffer events
+INTERVAL = 1.0
+
+
+class VoteJournal:
+    """Write vote events to a journal file in batches."""
+
+    def __init__(self, path, batch_size=BATCH_SIZE, interval=INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        # O_APPEND, so that processes sharing the journal do not overwrite each other
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._start()
+
+    def _start(self):
+        """Start with an empty buffer and a thread that writes it periodically."""
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._write_periodically,
+                                        name='vote-journal', daemon=True)
+        self._writer.start()
+
+    def _write_periodically(self):
+        while not self._closed.wait(self.interval):
+            self.flush()
+
+    def record(self, user_id, question_id, old_choice_id, new_choice_id, timestamp=None):
+        """Add a vote event to the journal."""
+        event = {'t': timestamp if timestamp is not None else time.time(),
+                 'user': user_id, 'question': question_id,
+                 'old': old_choice_id, 'new': new_choice_id}
+        with self._lock:
+            self._buffer.append(json.dumps(event, separators=(',', ':')))
+            if len(self._buffer) >= self.batch_size:
+                self._write()
+
+    def flush(self):
+        """Write all buffered events to the journal file."""
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        """Write buffered events.  The caller must hold the lock."""
+        if self._buffer and self._fd is not None:
+            data = ('\n'.join(self._buffer) + '\n').encode('utf-8')
+            # one write for the batch, so lines from different processes do not mix
+            os.write(self._fd, data)
+            os.fsync(self._fd)
+            self._buffer = []
+
+    def after_fork(self):
+        """Reset the journal in a new child process.
+
+        Events buffered by the parent are the parent's to write,
+        and the writer thread does not exist in the child.
+        """
+        self._start()
+
+    def close(self):
+        """Write buffered events and close the journal file."""
+        self._closed.set()
+        with self._lock:
+            if self._fd is None:
+                return
+            self._write()
+            os.close(self._fd)
+            self._fd = None
+
+
+def read_events(path):
+    """Yield the events in a journal file as dicts.
+
+    An incomplete last line, from a process that crashed while writing,
+    is ignored.
+    """
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            yield json.loads(line)
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """Return the VoteJournal for settings.POLLS_VOTE_JOURNAL, or None if not used."""
+    global _journal
+    path = getattr(settings, 'POLLS_VOTE_JOURNAL', None)
+    if not path:
+        return None
+    with _journal_lock:
+        if _journal is None or _journal.path != path:
+            if _journal:
+                _journal.close()
+            _journal = VoteJournal(path,
+                                   getattr(settings, 'POLLS_VOTE_JOURNAL_BATCH', BATCH_SIZE),
+                                   getattr(settings, 'POLLS_VOTE_JOURNAL_INTERVAL', INTERVAL))
+        return _journal
+
+
+def record_vote(user_id, question_id, old_choice_id, new_choice_id, timestamp=None):
+    """Add a vote to the journal, if one is used."""
+    journal = get_journal()
+    if journal:
+        journal.record(user_id, question_id, old_choice_id, new_choice_id, timestamp)
+
+
+def flush():
+    """Write the events buffered by this process, if a journal is used."""
+    if _journal:
+        _journal.flush()
+
+
+@atexit.register
+def _close_journal():
+    if _journal:
+        _journal.close()
+
+
+def _after_fork_in_child():
+    global _journal_lock
+    _journal_lock = threading.Lock()
+    if _journal:
+        _journal.after_fork()
+
+
+os.register_at_fork(before=flush, after_in_child=_after_fork_in_child)
+
+
+class Replay:
+    """The votes and tallies resulting from the events in a journal."""
+
+    def __init__(self):
+        # (question id, user id) -> (timestamp, choice id)
+        self.votes = {}
+        self.events = 0
+        # events older than a later event for the same user and question
+        self.out_of_order = 0
+        # events whose old choice is not the new choice of the previous event
+        self.mismatched = 0
+
+    def apply(self, event):
+        """Apply one event.  The latest event for a user and question wins."""
+        self.events += 1
+        key = (event['question'], event['user'])
+        previous = self.votes.get(key)
+        if previous and event['t'] < previous[0]:
+            self.out_of_order += 1
+            return
+        if event['old'] != (previous[1] if previous else None):
+            # an event is missing, or the journal was started after voting began
+            self.mismatched += 1
+        self.votes[key] = (event['t'], event['new'])
+
+    def question_votes(self):
+        """Return a dict of question id -> list of (user id, choice id) for its votes."""
+        votes = {}
+        for (question_id, user_id), (_, choice_id) in self.votes.items():
+            votes.setdefault(question_id, []).append((user_id, choice_id))
+        return votes
+
+
+def replay(events, question_ids=None):
+    """Replay vote events, optionally only for some questions.
+
+    :param events: iterable of events, such as from read_events()
+    :param question_ids: collection of question ids to replay, or None for all
+    :returns: a Replay
+    """
+    result = Replay()
+    for event in events:
+        if question_ids is None or event['question'] in question_ids:
+            result.apply(event)
+    return result
@@ -0,0 +1,56 @@
+"""Measure the time to render the polls templates."""
+import timeit
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from polls.models import Choice, Question
+
+
+def template_contexts(num_choices):
+    """Return (template name, context) for each polls template.
+
+    The context contains unsaved objects, so rendering does not use
+    the database, and any query made while rendering is a regression.
+    """
+    question = Question(id=1, question_text="Benchmark question")
+    choices = [Choice(id=n, question=question, choice_text=f"Choice {n:05d}")
+               for n in range(1, num_choices + 1)]
+    questions = [Question(id=n, question_text=f"Question {n}")
+                 for n in range(1, num_choices + 1)]
+    results = [{'id': choice.id, 'choice_text': choice.choice_text, 'votes': choice.id}
+               for choice in choices]
+    return [
+        ('polls/index.html', {'question_list': questions}),
+        ('polls/detail.html', {'question': question, 'choices': choices,
+                               'selected_choice': 1}),
+        ('polls/results.html', {'question': question, 'results': results}),
+    ]
+
+
+def render_time(template_name, context, repeat):
+    """Return the best time in seconds of several renderings of a template."""
+    request = RequestFactory().get('/polls/')
+    request.user = AnonymousUser()
+    timer = timeit.Timer(lambda: render_to_string(template_name, context, request))
+    # the first rendering loads the template
+    timer.timeit(1)
+    return min(timer.repeat(repeat=repeat, number=1))
+
+
+class Command(BaseCommand):
+    help = "Measure the time to render the index, detail, and results templates."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--choices', type=int, nargs='+', default=[10, 100, 1000],
+                            help="number of choices (or questions, for index) to render")
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="number of times to render each template")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'Template':20} {'Choices':>8} {'ms':>9}")
+        for num_choices in options['choices']:
+            for template_name, context in template_contexts(num_choices):
+                seconds = render_time(template_name, context, options['repeat'])
+                self.stdout.write(f"{template_name:20} {num_choices:8d} {1000*seconds:9.3f}")
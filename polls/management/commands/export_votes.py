@@ -0,0 +1,34 @@
+"""Export the votes for a poll question as CSV."""
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.export import CHUNK_SIZE, csv_chunks, export_csv
+from polls.models import Question
+
+
+class Command(BaseCommand):
+    help = "Export the votes for a poll question as CSV, without loading all votes into memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_id', type=int)
+        parser.add_argument('-o', '--output',
+                            help="file to write to. Default is standard output.")
+        parser.add_argument('--gzip', action='store_true',
+                            help="gzip compress the output. Requires --output.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f"rows to fetch at a time (default {CHUNK_SIZE})")
+
+    def handle(self, *args, **options):
+        try:
+            question = Question.objects.get(pk=options['question_id'])
+        except Question.DoesNotExist:
+            raise CommandError(f"Question id {options['question_id']} not found.")
+        chunk_size = options['chunk_size']
+        if options['output']:
+            with open(options['output'], 'wb') as out:
+                for data in export_csv(question, options['gzip'], chunk_size):
+                    out.write(data)
+        elif options['gzip']:
+            raise CommandError("--gzip requires --output")
+        else:
+            for chunk in csv_chunks(question, chunk_size):
+                self.stdout.write(chunk, ending='')
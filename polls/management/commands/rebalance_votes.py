@@ -0,0 +1,55 @@
+"""Move the votes for a poll question to another vote shard."""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from polls import results_cache, shards, tally
+from polls.models import Question, Vote
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ("Move the votes for a poll question to another vote shard. "
+            "Votes submitted while the votes are moved may be lost, "
+            "so run it while the poll is not receiving votes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_id', type=int)
+        parser.add_argument('shard', type=int, help="shard number to move votes to")
+
+    def handle(self, *args, **options):
+        count = shards.shard_count()
+        if not count:
+            raise CommandError("Votes are not sharded. Set POLLS_VOTE_SHARDS.")
+        shard = options['shard']
+        if not 0 <= shard < count:
+            raise CommandError(f"Shard must be 0 to {count - 1}.")
+        try:
+            question = Question.objects.get(pk=options['question_id'])
+        except Question.DoesNotExist:
+            raise CommandError(f"Question id {options['question_id']} not found.")
+        source = shards.vote_db(question)
+        target = shards.shard_alias(shard)
+        if source == target:
+            self.stdout.write(f"Votes for question {question.id} are already in {target}.")
+            return
+
+        votes = Vote.objects.for_question(question)
+        # Deleting first locks the source database until the copy is committed.
+        # Commits are in reverse order: target, then default, then source,
+        # so if one fails, the votes are still in the shard that vote_shard names.
+        # Vote ids are not copied, since each shard has its own sequence of ids.
+        with transaction.atomic(using=source), \
+             transaction.atomic(using=DEFAULT_DB_ALIAS), \
+             transaction.atomic(using=target):
+            rows = list(votes.values_list('user_id', 'choice_id'))
+            votes.delete()
+            Vote.objects.using(target).bulk_create(
+                (Vote(user_id=user_id, choice_id=choice_id) for user_id, choice_id in rows),
+                batch_size=BATCH_SIZE)
+            question.vote_shard = shard
+            question.save(update_fields=['vote_shard'])
+        tally.engine.discard(question.id)
+        results_cache.invalidate(question.id)
+        self.stdout.write(f"Moved {len(rows)} votes for question {question.id} "
+                          f"from {source} to {target}.")
@@ -0,0 +1,102 @@
+"""Check or rebuild votes from a vote journal."""
+import time
+from collections import Counter
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from polls import journal, results_cache, shards, tally
+from polls.models import Question, Vote
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ("Replay a vote journal and compare the resulting vote counts with the database, "
+            "or with --apply, replace the votes in the database with the votes from the journal. "
+            "Only use --apply with a journal that contains every vote for the questions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('journal', help="journal file to replay")
+        parser.add_argument('--question', type=int, action='append', dest='questions',
+                            metavar='QUESTION_ID',
+                            help="only replay votes for this question. May be repeated.")
+        parser.add_argument('--apply', action='store_true',
+                            help="replace the votes for each question in the journal")
+
+    def handle(self, *args, **options):
+        # flush votes recorded by this process
+        journal.flush()
+        start = time.perf_counter()
+        try:
+            question_ids = set(options['questions']) if options['questions'] else None
+            replay = journal.replay(journal.read_events(options['journal']), question_ids)
+        except OSError as ex:
+            raise CommandError(f"Cannot read journal: {ex}")
+        seconds = time.perf_counter() - start
+        question_votes = replay.question_votes()
+        self.stdout.write(f"Replayed {replay.events} events in {seconds:.2f} sec: "
+                          f"{len(replay.votes)} votes for {len(question_votes)} questions.")
+        if replay.out_of_order or replay.mismatched:
+            self.stdout.write(f"{replay.out_of_order} events were out of order, and "
+                              f"{replay.mismatched} events had an unexpected old choice.")
+
+        questions = Question.objects.in_bulk(list(question_votes))
+        for question_id in question_votes.keys() - questions.keys():
+            self.stderr.write(f"Question id {question_id} not found.")
+        if options['apply']:
+            for question in questions.values():
+                self.rebuild_votes(question, question_votes[question.id])
+        errors = 0
+        for question in questions.values():
+            errors += self.verify(question, question_votes[question.id])
+        if errors:
+            raise CommandError(f"Vote counts differ from the journal for {errors} questions.")
+        self.stdout.write("Vote counts match the journal.")
+
+    def live_votes(self, question, votes):
+        """Return the votes whose choice and user still exist.
+
+        The journal has no events for votes deleted with their choice or user.
+        """
+        choice_ids = set(question.choice_set.values_list('id', flat=True))
+        votes = [(user_id, choice_id) for user_id, choice_id in votes if choice_id in choice_ids]
+        user_ids = [user_id for user_id, _ in votes]
+        existing = set()
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            existing.update(User.objects.filter(id__in=user_ids[start:start + BATCH_SIZE])
+                                        .values_list('id', flat=True))
+        return [(user_id, choice_id) for user_id, choice_id in votes if user_id in existing]
+
+    def rebuild_votes(self, question, votes):
+        """Replace the votes for a question with votes from the journal."""
+        votes = self.live_votes(question, votes)
+        db = shards.vote_db(question)
+        with transaction.atomic(using=db):
+            Vote.objects.for_question(question).delete()
+            Vote.objects.using(db).bulk_create(
+                (Vote(user_id=user_id, choice_id=choice_id) for user_id, choice_id in votes),
+                batch_size=BATCH_SIZE)
+        tally.engine.discard(question.id)
+        results_cache.invalidate(question.id)
+        self.stdout.write(f"Rebuilt {len(votes)} votes for question {question.id}.")
+
+    def verify(self, question, votes) -> bool:
+        """Compare the vote counts for a question with counts from the journal.
+
+        Checks both the votes in the database and the results shown to users,
+        which may come from the tally engine or results cache.
+        :returns: True if any count differs
+        """
+        expected = Counter(choice_id for _, choice_id in self.live_votes(question, votes))
+        in_database = Counter(tally.count_votes(question))
+        shown = Counter({result['id']: result['votes']
+                         for result in tally.question_results(question)})
+        differ = False
+        for name, counts in (("database", in_database), ("results", shown)):
+            # + removes zero counts
+            if +counts != +expected:
+                self.stderr.write(f"Question {question.id}: {name} counts {dict(+counts)} "
+                                  f"but journal counts {dict(expected)}")
+                differ = True
+        return differ
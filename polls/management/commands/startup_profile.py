@@ -0,0 +1,79 @@
+"""Report the time for Django to start using the current settings."""
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# code run in a new interpreter to start Django
+SETUP_CODE = "import django; django.setup()"
+
+
+def run_setup(settings_module, importtime=False):
+    """Start Django in a new Python process.
+
+    :returns: tuple (seconds, stderr) for the whole process
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', SETUP_CODE]
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    start = time.perf_counter()
+    process = subprocess.run(command, cwd=settings.BASE_DIR, env=env,
+                             capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise CommandError(f"Django setup failed:\n{process.stderr}")
+    return seconds, process.stderr
+
+
+def import_times(importtime_output):
+    """Return the import time in microseconds of each top-level package.
+
+    :param importtime_output: stderr of python -X importtime
+    :returns: a Counter of package name -> microseconds
+    """
+    times = Counter()
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # the heading line
+            continue
+        package = fields[2].strip().split('.')[0]
+        times[package] += int(fields[0])
+    return times
+
+
+class Command(BaseCommand):
+    help = ("Report the time for a new process to start Django, "
+            "and the import time of each package, as with python -X importtime.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15,
+                            help="number of packages to show (default 15)")
+        parser.add_argument('--runs', type=int, default=3,
+                            help="number of times to start Django. The best time is used.")
+        parser.add_argument('--budget', type=float,
+                            help="maximum startup time in milliseconds. It is an error to exceed it.")
+
+    def handle(self, *args, **options):
+        settings_module = options.get('settings') or os.environ['DJANGO_SETTINGS_MODULE']
+        seconds = min(run_setup(settings_module)[0] for _ in range(options['runs']))
+        _, output = run_setup(settings_module, importtime=True)
+        times = import_times(output)
+
+        self.stdout.write(f"Settings: {settings_module}")
+        self.stdout.write(f"Startup time: {1000*seconds:.1f} ms")
+        self.stdout.write(f"Modules imported: {output.count('import time:') - 1}")
+        self.stdout.write(f"Import time: {sum(times.values())/1000:.1f} ms")
+        self.stdout.write(f"{'Package':30} {'ms':>8}")
+        for package, usec in times.most_common(options['top']):
+            self.stdout.write(f"{package:30} {usec/1000:8.1f}")
+        if options['budget'] is not None and 1000*seconds > options['budget']:
+            raise CommandError(f"Startup time {1000*seconds:.1f} ms exceeds "
+                               f"budget of {options['budget']:.0f} ms")
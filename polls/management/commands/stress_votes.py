@@ -0,0 +1,289 @@
+"""Submit many votes at the same time and check that the votes are correct."""
+import http.client
+import multiprocessing
+import random
+import secrets
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from polls import journal, shards
+from polls.models import Choice, Question, Vote
+from polls.tally import count_votes, question_results
+
+USERNAME_PREFIX = 'stress_'
+_local = threading.local()
+
+
+def vote_wsgi(path, choice_id, session_key):
+    """Submit a vote to the WSGI application in this process.
+
+    :returns: the HTTP status code
+    """
+    if not hasattr(_local, 'client'):
+        _local.client = Client(raise_request_exception=True)
+    _local.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+    return _local.client.post(path, {'choice': choice_id}).status_code
+
+
+def vote_http(url, path, choice_id, session_key):
+    """Submit a vote to a server at url.
+
+    :returns: the HTTP status code
+    """
+    parts = urllib.parse.urlsplit(url)
+    connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                        else http.client.HTTPConnection)
+    connection = connection_class(parts.netloc, timeout=60)
+    # any token in the correct format is accepted, if cookie and header are the same
+    token = secrets.token_hex(16)
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Cookie': f'{settings.SESSION_COOKIE_NAME}={session_key}; '
+                  f'{settings.CSRF_COOKIE_NAME}={token}',
+        'X-CSRFToken': token,
+        'Referer': url,
+    }
+    try:
+        connection.request('POST', parts.path.rstrip('/') + path,
+                           urllib.parse.urlencode({'choice': choice_id}), headers)
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+def submit(url, task):
+    """Submit one vote and classify the outcome.
+
+    :param task: tuple (path, user id, choice id, session key)
+    :returns: tuple (user id, choice id, outcome) where outcome is 'ok', 'locked', or an error
+    """
+    path, user_id, choice_id, session_key = task
+    try:
+        if url:
+            status = vote_http(url, path, choice_id, session_key)
+        else:
+            status = vote_wsgi(path, choice_id, session_key)
+    except OperationalError as ex:
+        return user_id, choice_id, 'locked' if 'locked' in str(ex) else f'OperationalError: {ex}'
+    except Exception as ex:
+        return user_id, choice_id, f'{type(ex).__name__}: {ex}'
+    # a successful vote redirects to the results page
+    return user_id, choice_id, 'ok' if status == 302 else f'HTTP {status}'
+
+
+def run_tasks(url, tasks, threads):
+    """Submit votes using a pool of threads.
+
+    :returns: tuple (dict of user id -> set of choice ids successfully voted for,
+              Counter of outcomes)
+    """
+    successes = defaultdict(set)
+    outcomes = Counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for user_id, choice_id, outcome in executor.map(lambda task: submit(url, task), tasks):
+            outcomes[outcome] += 1
+            if outcome == 'ok':
+                successes[user_id].add(choice_id)
+    connections.close_all()
+    # a pool process exits without writing its buffered journal events
+    journal.flush()
+    return successes, outcomes
+
+
+def run_phase(url, tasks, threads, processes):
+    """Submit votes using threads in this process or in several processes.
+
+    :returns: tuple (choices successfully voted for by each user, outcomes, seconds)
+    """
+    start = time.perf_counter()
+    if not processes:
+        successes, outcomes = run_tasks(url, tasks, threads)
+    else:
+        # child processes must not share this process's database connections
+        connections.close_all()
+        successes, outcomes = defaultdict(set), Counter()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+            parts = [tasks[n::processes] for n in range(processes)]
+            for part_successes, part_outcomes in executor.map(
+                    run_tasks, [url] * processes, parts, [threads] * processes):
+                for user_id, choice_ids in part_successes.items():
+                    successes[user_id].update(choice_ids)
+                outcomes.update(part_outcomes)
+    return successes, outcomes, time.perf_counter() - start
+
+
+def in_file(alias):
+    """Test if a database is in a file, so it can be shared by several connections."""
+    name = str(connections[alias].settings_dict['NAME'] or '')
+    return bool(name) and ':memory:' not in name and 'mode=memory' not in name
+
+
+def create_session(user):
+    """Create a logged in session for a user and return the session key."""
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return session.session_key
+
+
+class Command(BaseCommand):
+    help = ("Submit many votes at the same time, from threads and processes, "
+            "then check that each user has at most one vote and that the vote counts are correct. "
+            "Requires a database in a file, since the votes are submitted by several connections.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help="number of users who vote")
+        parser.add_argument('--choices', type=int, default=4, help="number of choices")
+        parser.add_argument('--votes', type=int, default=10,
+                            help="random votes by each user in the first phase")
+        parser.add_argument('--final-votes', type=int, default=3,
+                            help="votes by each user for their final choice, at the same time")
+        parser.add_argument('--threads', type=int, default=16, help="threads in each process")
+        parser.add_argument('--processes', type=int, default=0,
+                            help="processes to submit votes from. 0 uses only this process.")
+        parser.add_argument('--url', help="URL of a running server using this database, "
+                                          "e.g. http://localhost:8000. "
+                                          "Default is to call the WSGI application directly.")
+        parser.add_argument('--seed', type=int, help="random seed")
+        parser.add_argument('--keep', action='store_true',
+                            help="do not delete the question and users afterwards")
+
+    def handle(self, *args, **options):
+        if not in_file(DEFAULT_DB_ALIAS):
+            raise CommandError("stress_votes requires a database in a file.")
+        rand = random.Random(options['seed'])
+        question, users, sessions = self.create_poll(options)
+        choice_ids = list(question.choice_set.values_list('id', flat=True))
+        path = reverse('polls:vote', args=(question.id,))
+        try:
+            if not in_file(shards.vote_db(question)):
+                raise CommandError(f"stress_votes requires the vote database "
+                                   f"{shards.vote_db(question)} in a file.")
+            # First, users vote at random, changing their votes.
+            tasks = [(path, user.id, rand.choice(choice_ids), sessions[user.id])
+                     for user in users for _ in range(options['votes'])]
+            rand.shuffle(tasks)
+            random_successes, outcomes, seconds = run_phase(options['url'], tasks,
+                                                            options['threads'],
+                                                            options['processes'])
+            self.report("Random votes", random_successes, outcomes, seconds)
+            # Then each user votes for a final choice several times at once.
+            final_choice = {user.id: rand.choice(choice_ids) for user in users}
+            tasks = [(path, user_id, choice_id, sessions[user_id])
+                     for user_id, choice_id in final_choice.items()
+                     for _ in range(options['final_votes'])]
+            rand.shuffle(tasks)
+            successes, outcomes, seconds = run_phase(options['url'], tasks,
+                                                     options['threads'], options['processes'])
+            self.report("Final votes", successes, outcomes, seconds)
+            errors = self.check_votes(question, final_choice, successes, random_successes)
+            errors += self.check_journal(question, options['url'])
+        finally:
+            if not options['keep']:
+                Vote.objects.for_question(question).delete()
+                question.delete()
+                User.objects.filter(id__in=[user.id for user in users]).delete()
+        if errors:
+            raise CommandError(f"{errors} checks failed.")
+        self.stdout.write("All checks passed.")
+
+    def create_poll(self, options):
+        """Create a question with choices, and users with logged in sessions."""
+        question = Question.objects.create(
+                        question_text=f"Stress test {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        Choice.objects.bulk_create(Choice(question=question, choice_text=f"Choice {n}")
+                                   for n in range(1, options['choices'] + 1))
+        suffix = secrets.token_hex(4)
+        User.objects.bulk_create(User(username=f"{USERNAME_PREFIX}{suffix}_{n}", password='!')
+                                 for n in range(options['users']))
+        users = list(User.objects.filter(username__startswith=f"{USERNAME_PREFIX}{suffix}_"))
+        sessions = {user.id: create_session(user) for user in users}
+        return question, users, sessions
+
+    def report(self, phase, successes, outcomes, seconds):
+        total = sum(outcomes.values())
+        self.stdout.write(f"{phase}: {total} votes in {seconds:.2f} sec, "
+                          f"{outcomes['ok']/seconds:.0f} successful votes/sec, "
+                          f"{outcomes['locked']} lock errors")
+        for outcome, count in outcomes.most_common():
+            if outcome not in ('ok', 'locked'):
+                self.stdout.write(f"  {count} x {outcome}")
+
+    def check_votes(self, question, final_choice, successes, random_successes):
+        """Check the votes after voting, and return the number of failed checks.
+
+        Users whose final votes all failed may have any choice they successfully
+        voted for in the first phase, since the order in which concurrent votes
+        are saved is not known.  Their votes are counted as they are in the
+        database, if the choice is one of those.
+        """
+        errors = 0
+        votes = Vote.objects.for_question(question)
+        duplicates = (votes.order_by().values('user_id')
+                           .annotate(count=Count('id')).filter(count__gt=1).count())
+        if duplicates:
+            self.stdout.write(f"FAIL: {duplicates} users have more than one vote.")
+            errors += 1
+        user_choice = dict(votes.values_list('user_id', 'choice_id'))
+        wrong = [user_id for user_id in successes
+                 if user_choice.get(user_id) != final_choice[user_id]]
+        if wrong:
+            self.stdout.write(f"FAIL: {len(wrong)} users' votes are not their final choice.")
+            errors += 1
+        unverified = [user_id for user_id in final_choice if user_id not in successes]
+        if unverified:
+            self.stdout.write(f"{len(unverified)} users had no successful final vote.")
+        wrong = [user_id for user_id in unverified
+                 if user_choice.get(user_id) not in random_successes.get(user_id, {None})]
+        if wrong:
+            self.stdout.write(f"FAIL: {len(wrong)} users' votes are not a choice "
+                              f"they successfully voted for.")
+            errors += 1
+        expected = Counter(final_choice[user_id] for user_id in successes)
+        expected.update(user_choice[user_id] for user_id in unverified
+                        if user_choice.get(user_id) in random_successes.get(user_id, ()))
+        in_database = Counter(count_votes(question))
+        shown = Counter({result['id']: result['votes']
+                         for result in question_results(question)})
+        for name, counts in (("Database", in_database), ("Results", shown)):
+            if +counts != +expected:
+                self.stdout.write(f"FAIL: {name} vote counts {dict(+counts)} "
+                                  f"should be {dict(expected)}.")
+                errors += 1
+        return errors
+
+    def check_journal(self, question, url):
+        """Check the vote counts against the vote journal, if one is used.
+
+        :returns: the number of failed checks
+        """
+        if not journal.get_journal():
+            return 0
+        if url:
+            # the server may not have written its buffered events yet
+            self.stdout.write("Vote journal not checked, since votes were sent to a server.")
+            return 0
+        journal.flush()
+        try:
+            call_command('replay_votes', journal.get_journal().path, questions=[question.id],
+                         stdout=self.stdout, stderr=self.stdout)
+        except CommandError as ex:
+            self.stdout.write(f"FAIL: {ex}")
+            return 1
+        return 0
@@ -1,15 +1,32 @@
 """Models for the ku-polls application."""
 import datetime
+import random
+import time
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import OperationalError, models, transaction
 from django.utils import timezone
 
+from . import journal, shards
+
 
 class Question(models.Model):
     question_text = models.CharField(max_length=100)
     # automatically set pub_date to the current date & time
     pub_date = models.DateTimeField('date published', default=timezone.now)
     end_date = models.DateTimeField('closing date', null=True, blank=True)
+    # shard for this question's votes, if votes are sharded (see shards.py)
+    vote_shard = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.vote_shard is None and shards.shard_count():
+            self.place_votes()
+
+    def place_votes(self):
+        """Save the shard for this question's votes, so it does not change with the number of shards."""
+        self.vote_shard = shards.shard_number(self)
+        Question.objects.filter(pk=self.pk, vote_shard__isnull=True).update(
+                                                            vote_shard=self.vote_shard)
 
     def is_published(self):
         """Test if a poll question has been published."""
@@ -49,10 +66,40 @@ class Choice(models.Model):
         return self.vote_set.count()
 
 
+# number of times to try saving a vote when the database is locked
+VOTE_ATTEMPTS = 8
+# seconds to wait before the first retry. The wait doubles for each retry.
+RETRY_DELAY = 0.01
+
+
+class VoteManager(models.Manager):
+
+    def create(self, **kwargs):
+        """Create a vote in the database for its question, unless using() was called."""
+        if self._db:
+            return super().create(**kwargs)
+        vote = self.model(**kwargs)
+        # save() is routed using the vote's choice
+        vote.save(force_insert=True)
+        return vote
+
+    def for_question(self, question: Question):
+        """Return the votes for a question, from the database that contains them."""
+        db = shards.vote_db(question)
+        if not shards.shard_count():
+            return self.using(db).filter(choice__question=question)
+        # choices are in a different database, so they cannot be joined
+        choice_ids = list(question.choice_set.values_list('id', flat=True))
+        return self.using(db).filter(choice_id__in=choice_ids)
+
+
 class Vote(models.Model):
     """Records a Vote for a Choice by a User."""
-    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # no foreign key constraints, since votes may be in a different database
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, db_constraint=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+
+    objects = VoteManager()
 
     @classmethod
     def get_vote(cls, question: Question, user: User):
@@ -65,10 +112,70 @@ class Vote(models.Model):
         if not user or not user.is_authenticated:
             return None
         try:
-            return Vote.objects.get(user=user, choice__question=question)
+            return Vote.objects.for_question(question).get(user=user)
         except Vote.DoesNotExist:
             # no vote yet
             return None
 
+    @classmethod
+    def cast(cls, question: Question, user: User, choice: Choice):
+        """Save a user's vote for a choice, replacing the user's previous vote.
+
+        The previous vote is read and the vote saved in one transaction
+        that holds the SQLite write lock from the start, so concurrent votes
+        by a user cannot create two votes.  This is guaranteed only on SQLite,
+        which locks the whole database: other databases would need a unique
+        constraint on a vote's user and question.  If the database is still
+        locked by other transactions after waiting, the transaction is tried again.
+
+        The vote is added to the vote journal, if one is used, with the
+        time and previous choice read while the vote is being saved.
+
+        :returns: the id of the user's previous choice, or None if no previous vote
+        """
+        if question.vote_shard is None and shards.shard_count():
+            # a question created before votes were sharded
+            question.place_votes()
+        for attempt in range(VOTE_ATTEMPTS):
+            try:
+                db = shards.vote_db(question)
+                with transaction.atomic(using=db):
+                    cls._lock_votes(db)
+                    vote = cls.get_vote(question=question, user=user)
+                    if vote:
+                        old_choice_id = vote.choice_id
+                        vote.choice = choice
+                    else:
+                        # create a new vote
+                        old_choice_id = None
+                        vote = Vote(user=user, choice=choice)
+                    vote.save()
+                    # while other votes wait, so times are in the order votes are saved
+                    saved = time.time()
+                break
+
+            except OperationalError as ex:
+                if 'locked' not in str(ex) or attempt == VOTE_ATTEMPTS - 1:
+                    raise
+            # wait a random time, so retries are not at the same time
+            time.sleep(random.uniform(0, RETRY_DELAY * 2**attempt))
+        journal.record_vote(user.id, question.id, old_choice_id, choice.id, saved)
+        return old_choice_id
+
+    @classmethod
+    def _lock_votes(cls, db):
+        """Start writing in the current transaction, on SQLite.
+
+        SQLite cannot change a transaction that has read from the database
+        into a writing transaction while another connection is writing,
+        so a statement that writes nothing is executed first. It waits
+        for other writers to finish, rather than failing later.
+        """
+        connection = transaction.get_connection(db)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                table = connection.ops.quote_name(cls._meta.db_table)
+                cursor.execute(f'UPDATE {table} SET id = id WHERE 0')
+
     def __str__(self):
         return f'Vote by {self.user.username} for {self.choice.choice_text}'
\ No newline at end of file
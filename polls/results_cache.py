@@ -0,0 +1,198 @@
+"""Poll results shared by all worker processes on a host.
+
+If settings.POLLS_RESULTS_CACHE is the path of a file (e.g. in /dev/shm),
+results are stored in that file using a memory map, so that every
+process on the host reads the same results without a database query.
+Each question has a fixed-width record in a slot chosen by question id.
+
+Records are protected by a sequence number (a seqlock).  A writer locks
+the file, makes the sequence number odd, changes the record, and then
+makes the sequence number even again.  Readers never lock: they copy the
+record and try again if the sequence number was odd or has changed.
+
+Votes are also changed and deleted without vote() (e.g. when a user is
+deleted, or by loaddata), so a record is used for at most
+POLLS_RESULTS_CACHE_MAX_AGE seconds after it was written.  Records are
+always counted in the database, never copied from a process's in-memory
+tally, which may not include votes made in other processes.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows
+    fcntl = None
+
+MAGIC = b'POLLRES2'
+# default number of slots. A question is stored in slot (question id % slots).
+SLOTS = 256
+# questions with more choices than this are not cached
+MAX_CHOICES = 32
+# bytes for choice text: Choice.choice_text is at most 80 characters of UTF-8
+TEXT_SIZE = 320
+# default seconds that results are used after they are written
+MAX_AGE = 60
+# number of times a reader retries while a record is being written
+RETRIES = 100
+
+FILE_HEADER = struct.Struct('<8sII')       # magic, slots, max choices
+SEQUENCE = struct.Struct('<Q')
+SLOT_HEADER = struct.Struct('<QqI4xd')     # sequence, question id, number of choices, time written
+CHOICE = struct.Struct(f'<qq{TEXT_SIZE}s')  # choice id, votes, choice text
+SLOT_SIZE = SLOT_HEADER.size + MAX_CHOICES * CHOICE.size
+
+
+class ResultsCache:
+    """Fixed-width records of poll results in a memory-mapped file."""
+
+    def __init__(self, path, slots=SLOTS, max_age=MAX_AGE):
+        if fcntl is None:
+            raise ImproperlyConfigured("POLLS_RESULTS_CACHE requires fcntl file locking")
+        self.path = path
+        self.slots = slots
+        self.max_age = max_age
+        self.size = FILE_HEADER.size + slots * SLOT_SIZE
+        # serializes writers in this process, since flock is per-process
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._write_lock():
+            if os.fstat(self._fd).st_size < self.size:
+                os.ftruncate(self._fd, self.size)
+            self._buf = mmap.mmap(self._fd, self.size)
+            header = (MAGIC, slots, MAX_CHOICES)
+            if FILE_HEADER.unpack_from(self._buf) != header:
+                # new file, or written with a different layout
+                self._buf[:] = bytes(self.size)
+                FILE_HEADER.pack_into(self._buf, 0, *header)
+
+    def _write_lock(self):
+        return _FileLock(self._lock, self._fd)
+
+    def _offset(self, question_id):
+        return FILE_HEADER.size + (question_id % self.slots) * SLOT_SIZE
+
+    def get(self, question_id):
+        """Return the cached results for a question.
+
+        :returns: a tuple (results, version).  results is a list of dict
+                  with keys id, choice_text, and votes, or None if the
+                  question is not cached.  Pass version to put() to store
+                  results computed after a miss.
+        """
+        offset = self._offset(question_id)
+        for _ in range(RETRIES):
+            (seq,) = SEQUENCE.unpack_from(self._buf, offset)
+            if seq & 1:
+                continue
+            record = self._buf[offset:offset + SLOT_SIZE]
+            if SEQUENCE.unpack_from(self._buf, offset)[0] != seq:
+                continue
+            _, cached_id, count, written = SLOT_HEADER.unpack_from(record)
+            if cached_id != question_id or (self.max_age is not None
+                                            and time.time() - written > self.max_age):
+                return None, seq
+            results = []
+            for n in range(count):
+                choice_id, votes, text = CHOICE.unpack_from(
+                                record, SLOT_HEADER.size + n * CHOICE.size)
+                results.append({'id': choice_id,
+                                'choice_text': text.rstrip(b'\0').decode('utf-8'),
+                                'votes': votes})
+            return results, seq
+        # a writer is holding the record
+        return None, None
+
+    def put(self, question_id, results, version) -> bool:
+        """Store the results for a question, unless the slot changed since version.
+        
+        This prevents storing results that were computed before a vote
+        invalidated them.
+
+        :returns: True if the results were stored
+        """
+        if version is None or len(results) > MAX_CHOICES:
+            return False
+        offset = self._offset(question_id)
+        with self._write_lock():
+            if SEQUENCE.unpack_from(self._buf, offset)[0] != version:
+                return False
+            self._write(offset, question_id, results)
+        return True
+
+    def invalidate(self, question_id):
+        """Remove the results for a question, if they are cached."""
+        offset = self._offset(question_id)
+        with self._write_lock():
+            # always write, so the version seen by a concurrent miss changes
+            self._write(offset, 0, [])
+
+    def _write(self, offset, question_id, results):
+        """Write a record.  The caller must hold the write lock."""
+        (seq,) = SEQUENCE.unpack_from(self._buf, offset)
+        # odd while writing, even after a writer crashed while writing
+        writing = (seq + 1) | 1
+        SEQUENCE.pack_into(self._buf, offset, writing)
+        SLOT_HEADER.pack_into(self._buf, offset, writing, question_id, len(results),
+                              time.time())
+        for n, result in enumerate(results):
+            CHOICE.pack_into(self._buf, offset + SLOT_HEADER.size + n * CHOICE.size,
+                             result['id'], result['votes'],
+                             result['choice_text'].encode('utf-8'))
+        SEQUENCE.pack_into(self._buf, offset, writing + 1)
+
+    def close(self):
+        self._buf.close()
+        os.close(self._fd)
+
+
+class _FileLock:
+    """Exclusive lock on the cache file, for this thread and other processes."""
+
+    def __init__(self, lock, fd):
+        self.lock = lock
+        self.fd = fd
+
+    def __enter__(self):
+        self.lock.acquire()
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the ResultsCache for settings.POLLS_RESULTS_CACHE, or None if not used."""
+    global _cache
+    path = getattr(settings, 'POLLS_RESULTS_CACHE', None)
+    if not path:
+        return None
+    if _cache is None or _cache.path != path:
+        if _cache:
+            _cache.close()
+        _cache = ResultsCache(path,
+                              getattr(settings, 'POLLS_RESULTS_CACHE_SLOTS', SLOTS),
+                              getattr(settings, 'POLLS_RESULTS_CACHE_MAX_AGE', MAX_AGE))
+    return _cache
+
+
+def invalidate(question_id):
+    """Remove the results for a question from the shared cache, if it is used."""
+    cache = get_cache()
+    if cache:
+        cache.invalidate(question_id)
+
+
+def choice_changed(sender, instance, **kwargs):
+    """Signal receiver to invalidate results when a choice is saved or deleted."""
+    invalidate(instance.question_id)
@@ -0,0 +1,125 @@
+"""Store votes in several SQLite databases, by poll question.
+
+SQLite allows only one writer at a time for each database file.
+If settings.POLLS_VOTE_SHARDS is N > 0, votes are stored in N databases
+named votes_0 ... votes_<N-1> so that votes for questions in different
+shards can be written at the same time.  All other models are in the
+default database.
+
+A question's votes are in shard Question.vote_shard, which is set to
+(question id % N) when the question is created, or at its first vote for
+a question created before votes were sharded.  Since it is saved, changing
+the number of shards does not move existing polls' votes.  Use the
+rebalance_votes command to move a question's votes to another shard.
+
+Since votes and choices are in different databases, queries for votes
+cannot join the choice table.  Use Vote.objects.for_question(question)
+to query the votes for a question.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+
+VOTE_MODEL = 'polls.vote'
+
+
+def shard_count():
+    """Return the number of vote shards, or 0 if votes are not sharded."""
+    return getattr(settings, 'POLLS_VOTE_SHARDS', 0)
+
+
+def shard_alias(shard):
+    """Return the database alias for a vote shard number."""
+    return f'votes_{shard}'
+
+
+def shard_number(question):
+    """Return the shard number for a question's votes, or None if not sharded.
+
+    :raises ImproperlyConfigured: if the question's shard does not exist
+    """
+    count = shard_count()
+    if question.vote_shard is not None:
+        if question.vote_shard >= count:
+            raise ImproperlyConfigured(
+                f"Votes for question {question.id} are in shard {question.vote_shard}, "
+                f"but POLLS_VOTE_SHARDS is {count}.")
+        return question.vote_shard
+    if not count:
+        return None
+    return question.id % count
+
+
+def vote_db(question):
+    """Return the alias of the database containing the votes for a question."""
+    shard = shard_number(question)
+    return DEFAULT_DB_ALIAS if shard is None else shard_alias(shard)
+
+
+def _question_of(instance):
+    """Return the question an instance belongs to, or None."""
+    label = instance._meta.label_lower if instance is not None else None
+    if label == 'polls.question':
+        return instance
+    if label == 'polls.choice':
+        return instance.question
+    if label == VOTE_MODEL:
+        return instance.choice.question
+    return None
+
+
+class VoteShardRouter:
+    """Route Vote to the shard for its question, and all other models to default.
+
+    Does nothing if votes are not sharded.
+    """
+
+    def _db_for(self, model, instance=None, **hints):
+        if not shard_count():
+            return None
+        if model._meta.label_lower != VOTE_MODEL:
+            return DEFAULT_DB_ALIAS
+        question = _question_of(instance)
+        return vote_db(question) if question else None
+
+    db_for_read = _db_for
+    db_for_write = _db_for
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not shard_count():
+            return None
+        if VOTE_MODEL in (obj1._meta.label_lower, obj2._meta.label_lower):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the default database also has an (unused) vote table,
+        # so deleting a choice does not fail when collecting its votes
+        if db.startswith('votes_'):
+            return app_label == 'polls' and model_name == 'vote'
+        return None
+
+
+# Deleting a question, choice, or user cascades only to votes in the default
+# database, so these pre_delete receivers delete the votes in the shards.
+
+def delete_question_votes(sender, instance, **kwargs):
+    """Delete the votes in a shard for a question that is being deleted."""
+    if shard_count():
+        from .models import Vote
+        Vote.objects.for_question(instance).delete()
+
+
+def delete_choice_votes(sender, instance, **kwargs):
+    """Delete the votes in a shard for a choice that is being deleted."""
+    if shard_count():
+        from .models import Vote
+        Vote.objects.using(vote_db(instance.question)).filter(choice_id=instance.id).delete()
+
+
+def delete_user_votes(sender, instance, **kwargs):
+    """Delete the votes in all shards by a user who is being deleted."""
+    if shard_count():
+        from .models import Vote
+        for shard in range(shard_count()):
+            Vote.objects.using(shard_alias(shard)).filter(user_id=instance.id).delete()
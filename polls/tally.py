@@ -0,0 +1,233 @@
+"""Vote counts for poll results, optionally kept in memory.
+
+For a few polls that receive many votes, counting votes in the database
+for each view of the results is wasteful.  If settings.POLLS_TALLY_ENGINE
+is True, the tallies for recently viewed polls are kept in memory:
+a count for each choice in an array('q') and a map of user id to
+choice position.  Tallies are rebuilt from the Vote table the first time
+a poll is viewed, updated by each vote, and rebuilt again after
+POLLS_TALLY_MAX_AGE seconds so that votes made by other processes
+are eventually included.  Votes are always saved in the database,
+so the database remains the durable record of votes.
+"""
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models import Count
+
+from . import results_cache, shards
+from .models import Question, Vote
+
+# default number of polls to keep tallies for
+MAX_QUESTIONS = 20
+# default seconds before a tally is rebuilt from the database
+MAX_AGE = 60
+# number of votes read from the database at a time when building a tally
+CHUNK_SIZE = 2000
+
+
+class QuestionTally:
+    """Vote counts for the choices of one poll question."""
+
+    def __init__(self, choices):
+        """Create an empty tally.
+        
+        :param choices: sequence of (choice id, choice text) in display order
+        """
+        self.choice_ids = [choice_id for choice_id, _ in choices]
+        self.choice_text = [text for _, text in choices]
+        self.position = {choice_id: n for n, choice_id in enumerate(self.choice_ids)}
+        self.counts = array('q', [0] * len(self.choice_ids))
+        # user id -> position of the user's choice
+        self.voters = {}
+        self.created = time.monotonic()
+
+    def record(self, user_id, choice_id) -> bool:
+        """Record a user's vote, replacing any previous vote by the same user.
+        
+        :returns: False if the choice is not part of this tally
+        """
+        new = self.position.get(choice_id)
+        if new is None:
+            return False
+        old = self.voters.get(user_id)
+        if old is not None:
+            self.counts[old] -= 1
+        self.voters[user_id] = new
+        self.counts[new] += 1
+        return True
+
+    def results(self):
+        """Return the results as a list of dict with id, choice_text, and votes."""
+        return [{'id': choice_id, 'choice_text': text, 'votes': votes}
+                for choice_id, text, votes
+                in zip(self.choice_ids, self.choice_text, self.counts)]
+
+
+class _Load:
+    """Votes recorded while a tally is being built from the database."""
+
+    def __init__(self):
+        self.votes = []
+        # False if the tally was discarded while it was built
+        self.valid = True
+
+
+class TallyEngine:
+    """Keep in-memory tallies for the most recently viewed poll questions."""
+
+    def __init__(self):
+        self._tallies = OrderedDict()
+        # question id -> list of _Load for tallies being built
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'POLLS_TALLY_ENGINE', False)
+
+    def load(self, question: Question) -> QuestionTally:
+        """Build the tally for a question from the votes in the database.
+
+        Votes are read in chunks ordered by id, each a separate query, so that
+        a large poll does not keep a read lock on the database while votes
+        are saved.  Votes recorded while the tally is built are applied by get().
+        """
+        choices = (question.choice_set.order_by('choice_text')
+                                      .values_list('id', 'choice_text'))
+        tally = QuestionTally(list(choices))
+        votes = (Vote.objects.using(shards.vote_db(question))
+                             .filter(choice_id__in=tally.choice_ids)
+                             .order_by('id')
+                             .values_list('id', 'user_id', 'choice_id'))
+        last_id = 0
+        while True:
+            chunk = list(votes.filter(id__gt=last_id)[:CHUNK_SIZE])
+            for _, user_id, choice_id in chunk:
+                tally.record(user_id, choice_id)
+            if len(chunk) < CHUNK_SIZE:
+                return tally
+            last_id = chunk[-1][0]
+
+    def get(self, question: Question) -> QuestionTally:
+        """Return the tally for a question, building it if necessary.
+
+        The tally is built without holding the lock, so votes and results
+        for other questions are not delayed.  Votes recorded meanwhile are
+        applied to the new tally afterwards; a vote that is also in the
+        database is counted only once, since a user has only one choice
+        in the tally.
+        """
+        question_id = question.id
+        max_age = getattr(settings, 'POLLS_TALLY_MAX_AGE', MAX_AGE)
+        with self._lock:
+            tally = self._tallies.get(question_id)
+            if tally and (max_age is None
+                          or time.monotonic() - tally.created < max_age):
+                self._tallies.move_to_end(question_id)
+                return tally
+            load = _Load()
+            self._loading.setdefault(question_id, []).append(load)
+        try:
+            tally = self.load(question)
+        except Exception:
+            with self._lock:
+                self._end_load(question_id, load)
+            raise
+        with self._lock:
+            self._end_load(question_id, load)
+            complete = all([tally.record(user_id, choice_id)
+                            for user_id, choice_id in load.votes])
+            if load.valid and complete:
+                self._tallies[question_id] = tally
+                self._tallies.move_to_end(question_id)
+                max_questions = getattr(settings, 'POLLS_TALLY_MAX_QUESTIONS',
+                                        MAX_QUESTIONS)
+                while len(self._tallies) > max_questions:
+                    self._tallies.popitem(last=False)
+        return tally
+
+    def _end_load(self, question_id, load):
+        """Stop recording votes for a load.  The caller must hold the lock."""
+        loads = self._loading[question_id]
+        loads.remove(load)
+        if not loads:
+            del self._loading[question_id]
+
+    def record_vote(self, question_id, user_id, choice_id):
+        """Update the tally for a question, if there is one, after a vote is saved."""
+        with self._lock:
+            for load in self._loading.get(question_id, []):
+                load.votes.append((user_id, choice_id))
+            tally = self._tallies.get(question_id)
+            if tally and not tally.record(user_id, choice_id):
+                # choice added since the tally was built
+                del self._tallies[question_id]
+
+    def discard(self, question_id):
+        """Remove the tally for a question, so it is rebuilt when next used."""
+        with self._lock:
+            self._tallies.pop(question_id, None)
+            for load in self._loading.get(question_id, []):
+                load.valid = False
+
+    def clear(self):
+        """Remove all tallies."""
+        with self._lock:
+            self._tallies.clear()
+            for loads in self._loading.values():
+                for load in loads:
+                    load.valid = False
+
+
+engine = TallyEngine()
+
+
+def choice_changed(sender, instance, **kwargs):
+    """Signal receiver to discard a tally when a choice is saved or deleted."""
+    engine.discard(instance.question_id)
+
+
+def count_votes(question: Question):
+    """Count the votes for a question in the database.
+
+    :returns: dict of choice id -> number of votes, for choices with votes
+    """
+    # count votes without a join, since votes may be in another database
+    return dict(Vote.objects.for_question(question)
+                            .order_by()
+                            .values('choice_id')
+                            .annotate(votes=Count('id'))
+                            .values_list('choice_id', 'votes'))
+
+
+def database_results(question: Question):
+    """Return the vote count for each choice of a question, counted in the database."""
+    counts = count_votes(question)
+    return [{'id': choice_id, 'choice_text': text, 'votes': counts.get(choice_id, 0)}
+            for choice_id, text in question.choice_set.order_by('choice_text')
+                                           .values_list('id', 'choice_text')]
+
+
+def question_results(question: Question):
+    """Return the vote count for each choice of a question, sorted by choice text.
+
+    Results are read from the shared results cache if it is used, or else
+    from the in-memory tally or the database.  The shared cache is filled
+    only from the database, since a tally may lack recent votes made
+    in other processes.
+
+    :returns: list of dict with keys id, choice_text, and votes
+    """
+    cache = results_cache.get_cache()
+    if cache:
+        results, version = cache.get(question.id)
+        if results is None:
+            results = database_results(question)
+            cache.put(question.id, results, version)
+        return results
+    if engine.enabled:
+        return engine.get(question).results()
+    return database_results(question)
@@ -0,0 +1,91 @@
+"""Tests of exporting votes as CSV."""
+import csv
+import gzip
+import io
+import os
+import tempfile
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .export import vote_rows
+from .shards import vote_db
+from .models import Choice, Question, Vote
+
+
+class ExportTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """Create a poll with some votes, and a staff user who may export it."""
+        super().setUp()
+        self.question = Question.objects.create(question_text="Export me")
+        self.choices = [Choice.objects.create(question=self.question,
+                                              choice_text=f"Choice {n}")
+                        for n in range(1, 4)]
+        self.voters = [User.objects.create_user(f"voter{n}", password="hackme")
+                       for n in range(5)]
+        for n, user in enumerate(self.voters):
+            Vote.objects.create(user=user, choice=self.choices[n % 3])
+        self.admin = User.objects.create_user("staff", password="FatChance",
+                                              is_staff=True)
+        self.url = reverse('polls:export_csv', args=(self.question.id,))
+
+    def expected_rows(self):
+        """The export as a list of rows, including the header."""
+        rows = [['vote_id', 'user_id', 'choice_id', 'choice_text']]
+        for vote in Vote.objects.for_question(self.question).order_by('id'):
+            rows.append([str(vote.id), str(vote.user.id), str(vote.choice.id),
+                         vote.choice.choice_text])
+        return rows
+
+    def test_export_requires_staff(self):
+        """A user who is not staff cannot export votes."""
+        self.client.login(username="voter1", password="hackme")
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(response.streaming)
+
+    def test_export_csv(self):
+        """Staff can download all votes for a poll as CSV."""
+        self.client.login(username="staff", password="FatChance")
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(list(csv.reader(io.StringIO(content))),
+                         self.expected_rows())
+
+    def test_export_gzip(self):
+        """With ?gzip=1 the same CSV is gzip compressed."""
+        self.client.login(username="staff", password="FatChance")
+        response = self.client.get(self.url, {'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(list(csv.reader(io.StringIO(content.decode('utf-8')))),
+                         self.expected_rows())
+
+    def test_export_in_chunks(self):
+        """Votes are read with one query per chunk, not one open cursor."""
+        with CaptureQueriesContext(connections[vote_db(self.question)]) as queries:
+            rows = list(vote_rows(self.question, chunk_size=2))
+        # chunks of 2, 2, and 1 votes
+        vote_queries = [q for q in queries if 'polls_vote' in q['sql']]
+        self.assertEqual(len(vote_queries), 3)
+        self.assertEqual([list(map(str, row)) for row in rows], self.expected_rows()[1:])
+
+    def test_export_command(self):
+        """The export_votes command writes the same CSV, in small chunks."""
+        out = io.StringIO()
+        call_command('export_votes', self.question.id, chunk_size=2, stdout=out)
+        self.assertEqual(list(csv.reader(io.StringIO(out.getvalue()))),
+                         self.expected_rows())
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'votes.csv.gz')
+            call_command('export_votes', self.question.id,
+                         output=filename, gzip=True, chunk_size=2)
+            with gzip.open(filename, 'rt', newline='') as f:
+                self.assertEqual(list(csv.reader(f)), self.expected_rows())
@@ -0,0 +1,122 @@
+"""Tests of the vote journal."""
+import io
+import os
+import tempfile
+import time
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from . import journal
+from .journal import VoteJournal, read_events, replay
+from .models import Choice, Question, Vote
+
+
+class VoteJournalTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'votes.jsonl')
+
+    def tearDown(self):
+        if journal._journal:
+            journal._journal.close()
+            journal._journal = None
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def test_write_in_batches(self):
+        """Events are written when a batch is full, and when the journal is closed."""
+        vote_journal = VoteJournal(self.path, batch_size=2, interval=60)
+        vote_journal.record(1, 1, None, 10, timestamp=1.0)
+        self.assertEqual(list(read_events(self.path)), [])
+        vote_journal.record(1, 1, 10, 11, timestamp=2.0)
+        vote_journal.record(2, 1, None, 11, timestamp=3.0)
+        self.assertEqual(len(list(read_events(self.path))), 2)
+        vote_journal.close()
+        events = list(read_events(self.path))
+        self.assertEqual(events[1], {'t': 2.0, 'user': 1, 'question': 1,
+                                     'old': 10, 'new': 11})
+        self.assertEqual(len(events), 3)
+
+    def test_write_periodically(self):
+        """Buffered events are written after the interval, without another vote."""
+        vote_journal = VoteJournal(self.path, batch_size=100, interval=0.05)
+        vote_journal.record(1, 1, None, 10, timestamp=1.0)
+        deadline = time.monotonic() + 5
+        while not list(read_events(self.path)) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(len(list(read_events(self.path))), 1)
+        vote_journal.close()
+
+    def test_fork(self):
+        """Events buffered before a fork are written once, by the parent."""
+        with override_settings(POLLS_VOTE_JOURNAL=self.path, POLLS_VOTE_JOURNAL_BATCH=100,
+                               POLLS_VOTE_JOURNAL_INTERVAL=60):
+            journal.record_vote(1, 1, None, 10, timestamp=1.0)
+            pid = os.fork()
+            if pid == 0:
+                # the child journals its own vote only
+                journal.record_vote(2, 1, None, 10, timestamp=2.0)
+                journal.flush()
+                os._exit(0)
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(status, 0)
+            journal.flush()
+        events = sorted(event['user'] for event in read_events(self.path))
+        self.assertEqual(events, [1, 2])
+
+    def test_replay(self):
+        """The latest event for each user wins, and an incomplete line is ignored."""
+        vote_journal = VoteJournal(self.path, batch_size=1)
+        vote_journal.record(1, 1, None, 10, timestamp=1.0)
+        vote_journal.record(1, 1, 10, 11, timestamp=3.0)
+        # older than the previous event
+        vote_journal.record(1, 1, 10, 12, timestamp=2.0)
+        # first vote by user 2, but the old choice is not None
+        vote_journal.record(2, 1, 12, 10, timestamp=4.0)
+        vote_journal.record(2, 1, 10, 11, timestamp=5.0)
+        vote_journal.close()
+        with open(self.path, 'a') as f:
+            f.write('{"t": 6.0, "user": 3')
+        result = replay(read_events(self.path))
+        self.assertEqual(result.events, 5)
+        self.assertEqual(result.out_of_order, 1)
+        self.assertEqual(result.mismatched, 1)
+        self.assertEqual(result.question_votes(), {1: [(1, 11), (2, 11)]})
+
+    def test_vote_and_replay_command(self):
+        """Votes are journaled, and replay_votes checks and rebuilds votes."""
+        question = Question.objects.create(question_text="Journal me")
+        choices = [Choice.objects.create(question=question, choice_text=text)
+                   for text in ("Yes", "No")]
+        for n in range(3):
+            User.objects.create_user(f"user{n}", password="FatChance")
+        url = reverse('polls:vote', args=(question.id,))
+        with override_settings(POLLS_VOTE_JOURNAL=self.path, POLLS_VOTE_JOURNAL_BATCH=10):
+            for n, choice in enumerate([0, 1, 1]):
+                self.client.login(username=f"user{n}", password="FatChance")
+                self.client.post(url, {'choice': choices[choice].id})
+            # user2 changes their vote
+            self.client.post(url, {'choice': choices[0].id})
+            call_command('replay_votes', self.path, stdout=io.StringIO())
+        events = list(read_events(self.path))
+        self.assertEqual(len(events), 4)
+        self.assertEqual((events[3]['old'], events[3]['new']), (choices[1].id, choices[0].id))
+
+        # lose the votes, then rebuild them from the journal
+        Vote.objects.for_question(question).delete()
+        with self.assertRaises(CommandError):
+            call_command('replay_votes', self.path, stdout=io.StringIO(), stderr=io.StringIO())
+        call_command('replay_votes', self.path, apply=True, stdout=io.StringIO())
+        self.assertEqual([choice.votes for choice in choices], [2, 1])
+
+        # votes deleted with their user are not replayed
+        User.objects.get(username="user1").delete()
+        call_command('replay_votes', self.path, stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('replay_votes', self.path, apply=True, stdout=out)
+        self.assertIn("Rebuilt 2 votes", out.getvalue())
+        self.assertEqual([choice.votes for choice in choices], [2, 0])
@@ -0,0 +1,111 @@
+"""Tests of the results cache shared by worker processes."""
+import multiprocessing
+import os
+import tempfile
+import time
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from . import results_cache, tally
+from .models import Choice, Question, Vote
+from .results_cache import MAX_CHOICES, ResultsCache
+from .tally import question_results
+
+
+def put_results(path, question_id, results):
+    """Store results in the cache from another process."""
+    cache = ResultsCache(path)
+    _, version = cache.get(question_id)
+    cache.put(question_id, results, version)
+    cache.close()
+
+
+class ResultsCacheTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'results')
+        self.cache = ResultsCache(self.path, slots=8)
+        self.results = [{'id': 1, 'choice_text': "Yes", 'votes': 3},
+                        {'id': 2, 'choice_text': "Ño ✓", 'votes': 0}]
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def test_put_and_get(self):
+        """Results can be stored and read back, but only for the same question."""
+        results, version = self.cache.get(5)
+        self.assertIsNone(results)
+        self.assertTrue(self.cache.put(5, self.results, version))
+        self.assertEqual(self.cache.get(5)[0], self.results)
+        # question 13 uses the same slot as 5
+        self.assertIsNone(self.cache.get(13)[0])
+
+    def test_put_after_invalidate(self):
+        """Results computed before an invalidation are not stored."""
+        _, version = self.cache.get(5)
+        self.cache.invalidate(5)
+        self.assertFalse(self.cache.put(5, self.results, version))
+        self.assertIsNone(self.cache.get(5)[0])
+
+    def test_max_age(self):
+        """Results are not used after max_age seconds."""
+        _, version = self.cache.get(5)
+        self.cache.put(5, self.results, version)
+        self.cache.max_age = 0
+        with mock.patch('time.time', return_value=time.time() + 1):
+            results, version = self.cache.get(5)
+        self.assertIsNone(results)
+        # and can be replaced
+        self.assertTrue(self.cache.put(5, self.results, version))
+
+    def test_too_many_choices(self):
+        """Results with more than MAX_CHOICES choices are not cached."""
+        results = [{'id': n, 'choice_text': str(n), 'votes': n}
+                   for n in range(MAX_CHOICES + 1)]
+        _, version = self.cache.get(5)
+        self.assertFalse(self.cache.put(5, results, version))
+
+    def test_shared_between_processes(self):
+        """Results stored by one process are read by another."""
+        process = multiprocessing.get_context('fork').Process(
+                        target=put_results, args=(self.path, 6, self.results))
+        process.start()
+        process.join()
+        self.assertEqual(self.cache.get(6)[0], self.results)
+
+    def test_results_view_uses_cache(self):
+        """Results are cached when viewed, and invalidated by a vote."""
+        question = Question.objects.create(question_text="Cache me")
+        choice = Choice.objects.create(question=question, choice_text="Yes")
+        User.objects.create_user("user1", password="FatChance")
+        url = reverse('polls:results', args=(question.id,))
+        with override_settings(POLLS_RESULTS_CACHE=self.path):
+            self.client.get(url)
+            expected = [{'id': choice.id, 'choice_text': "Yes", 'votes': 0}]
+            self.assertEqual(results_cache.get_cache().get(question.id)[0], expected)
+            self.client.login(username="user1", password="FatChance")
+            self.client.post(reverse('polls:vote', args=(question.id,)),
+                             {'choice': choice.id})
+            self.assertIsNone(results_cache.get_cache().get(question.id)[0])
+            self.assertEqual(question_results(question)[0]['votes'], 1)
+            # adding a choice invalidates the cached results
+            Choice.objects.create(question=question, choice_text="No")
+            self.assertEqual(len(question_results(question)), 2)
+
+    def test_tally_not_shared(self):
+        """The shared cache is filled from the database, not from a tally that may be behind."""
+        question = Question.objects.create(question_text="Tally me")
+        choice = Choice.objects.create(question=question, choice_text="Yes")
+        self.addCleanup(tally.engine.clear)
+        with override_settings(POLLS_TALLY_ENGINE=True, POLLS_RESULTS_CACHE=self.path):
+            tally.engine.get(question)
+            # a vote by another process, which this process's tally does not have
+            Vote.objects.create(user=User.objects.create_user("user1"), choice=choice)
+            self.assertEqual(question_results(question)[0]['votes'], 1)
+            self.assertEqual(results_cache.get_cache().get(question.id)[0][0]['votes'], 1)
@@ -0,0 +1,125 @@
+"""Tests of storing votes in several databases.
+
+Tests that use the vote shards run only when votes are sharded, e.g.
+    POLLS_VOTE_SHARDS=2 python manage.py test
+"""
+import io
+import unittest
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from . import shards
+from .models import Choice, Question, Vote
+from .tally import question_results
+
+
+@override_settings(POLLS_VOTE_SHARDS=3)
+class VoteShardRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = shards.VoteShardRouter()
+        self.question = Question(id=7, question_text="Which shard?")
+        self.choice = Choice(id=1, question=self.question, choice_text="This one")
+        self.vote = Vote(choice=self.choice, user=User(id=1))
+
+    def test_vote_db(self):
+        """Votes are in shard (question id % shards), unless vote_shard is set."""
+        self.assertEqual(shards.vote_db(self.question), 'votes_1')
+        with override_settings(POLLS_VOTE_SHARDS=0):
+            self.assertEqual(shards.vote_db(self.question), DEFAULT_DB_ALIAS)
+        self.question.vote_shard = 2
+        self.assertEqual(shards.vote_db(self.question), 'votes_2')
+
+    def test_missing_shard(self):
+        """A question whose shard is not configured is an error, not an empty poll."""
+        self.question.vote_shard = 2
+        for count in (0, 2):
+            with override_settings(POLLS_VOTE_SHARDS=count):
+                with self.assertRaises(ImproperlyConfigured):
+                    shards.vote_db(self.question)
+
+    def test_route_votes_by_question(self):
+        """Votes are routed by the question of a related instance."""
+        for instance in (self.question, self.choice, self.vote):
+            self.assertEqual(self.router.db_for_read(Vote, instance=instance), 'votes_1')
+            self.assertEqual(self.router.db_for_write(Vote, instance=instance), 'votes_1')
+        # other models are always in the default database
+        self.assertEqual(self.router.db_for_read(Choice, instance=self.vote),
+                         DEFAULT_DB_ALIAS)
+        self.assertTrue(self.router.allow_relation(self.vote, self.choice))
+
+    def test_allow_migrate(self):
+        """Shards contain only the vote table."""
+        self.assertTrue(self.router.allow_migrate('votes_0', 'polls', 'vote'))
+        self.assertFalse(self.router.allow_migrate('votes_0', 'polls', 'choice'))
+        self.assertFalse(self.router.allow_migrate('votes_0', 'auth', 'user'))
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'polls', 'vote'))
+
+
+@unittest.skipUnless(shards.shard_count() >= 2, "votes are not sharded")
+class ShardedVotingTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.question = Question.objects.create(question_text="Sharded question")
+        self.choices = [Choice.objects.create(question=self.question, choice_text=text)
+                        for text in ("Yes", "No")]
+        self.user = User.objects.create_user("user1", password="FatChance")
+        self.client.login(username="user1", password="FatChance")
+
+    def vote(self, choice):
+        self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                         {'choice': choice.id})
+
+    def test_vote_stored_in_shard(self):
+        """A vote is stored in the question's shard, and can be changed."""
+        self.vote(self.choices[0])
+        self.vote(self.choices[1])
+        shard = shards.vote_db(self.question)
+        self.assertEqual(Vote.objects.using(shard).count(), 1)
+        self.assertEqual(Vote.get_vote(self.question, self.user).choice, self.choices[1])
+        self.assertEqual(self.choices[1].votes, 1)
+        self.assertEqual([r['votes'] for r in question_results(self.question)], [1, 0])
+
+    def test_shard_saved(self):
+        """A question's shard is saved, so it does not change with the number of shards."""
+        self.question.refresh_from_db()
+        shard = self.question.id % shards.shard_count()
+        self.assertEqual(self.question.vote_shard, shard)
+        with override_settings(POLLS_VOTE_SHARDS=shards.shard_count() + 1):
+            self.assertEqual(shards.shard_number(self.question), shard)
+        # a question created before votes were sharded gets its shard at the next vote
+        Question.objects.filter(pk=self.question.pk).update(vote_shard=None)
+        self.vote(self.choices[0])
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.vote_shard, shard)
+
+    def test_rebalance_votes(self):
+        """rebalance_votes moves a question's votes to another shard."""
+        self.vote(self.choices[0])
+        source = shards.vote_db(self.question)
+        shard = (shards.shard_number(self.question) + 1) % shards.shard_count()
+        call_command('rebalance_votes', self.question.id, shard, stdout=io.StringIO())
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.vote_shard, shard)
+        self.assertEqual(Vote.objects.using(source).count(), 0)
+        self.assertEqual(Vote.objects.using(shards.shard_alias(shard)).count(), 1)
+        self.assertEqual(Vote.get_vote(self.question, self.user).choice, self.choices[0])
+
+    def test_delete_removes_shard_votes(self):
+        """Deleting a user, choice, or question deletes its votes in the shard."""
+        shard = shards.vote_db(self.question)
+        other = User.objects.create_user("user2", password="FatChance")
+        Vote.objects.create(user=self.user, choice=self.choices[0])
+        Vote.objects.create(user=other, choice=self.choices[1])
+        self.user.delete()
+        self.assertEqual(Vote.objects.using(shard).count(), 1)
+        self.choices[1].delete()
+        self.assertEqual(Vote.objects.using(shard).count(), 0)
+        Vote.objects.create(user=other, choice=self.choices[0])
+        self.question.delete()
+        self.assertEqual(Vote.objects.using(shard).count(), 0)
@@ -0,0 +1,49 @@
+"""Tests of startup time and the settings for worker processes."""
+import io
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from mysite import settings_worker
+from .management.commands.startup_profile import import_times, run_setup
+from .models import Choice, Question
+
+# number of times to start Django. The best time is compared with the budget.
+STARTUP_RUNS = 5
+
+
+class StartupTest(TestCase):
+    databases = '__all__'
+
+    def test_startup_budget(self):
+        """A worker process starts within settings.STARTUP_TIME_BUDGET_MS.
+
+        The time includes starting Python.  Set STARTUP_TIME_BUDGET_MS
+        in the environment to change the budget for a slow machine.
+        """
+        out = io.StringIO()
+        call_command('startup_profile', settings='mysite.settings_worker',
+                     runs=STARTUP_RUNS, budget=settings.STARTUP_TIME_BUDGET_MS, stdout=out)
+        self.assertIn("Startup time:", out.getvalue())
+
+    def test_worker_does_not_import_unused_apps(self):
+        """The worker settings do not import the admin, messages, or staticfiles apps."""
+        _, output = run_setup('mysite.settings_worker', importtime=True)
+        modules = {line.split('|')[-1].strip() for line in output.splitlines()}
+        self.assertIn('django.contrib.auth.models', modules)
+        for app in settings_worker.UNUSED_APPS:
+            self.assertNotIn(app, modules)
+        self.assertIn('django', import_times(output))
+
+    @override_settings(MIDDLEWARE=settings_worker.MIDDLEWARE)
+    def test_vote_without_messages(self):
+        """Voting works without the messages middleware."""
+        question = Question.objects.create(question_text="Worker question")
+        choice = Choice.objects.create(question=question, choice_text="Yes")
+        User.objects.create_user("user1", password="FatChance")
+        self.client.login(username="user1", password="FatChance")
+        response = self.client.post(reverse('polls:vote', args=(question.id,)),
+                                    {'choice': choice.id})
+        self.assertRedirects(response, reverse('polls:results', args=(question.id,)))
+        self.assertEqual(choice.votes, 1)
@@ -0,0 +1,52 @@
+"""Stress test of voting by many threads and processes at the same time.
+
+This test is skipped unless the test database is in a file:
+    TEST_DB_FILE=/tmp/test_polls.sqlite3 python manage.py test polls.test_stress
+"""
+import io
+import os
+import tempfile
+import unittest
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TransactionTestCase, override_settings
+from . import journal
+from .models import Question, Vote
+
+
+@unittest.skipIf(connection.creation.is_in_memory_db(
+                    connection.settings_dict['TEST'].get('NAME') or ':memory:'),
+                 "test database is in memory")
+class StressTest(TransactionTestCase):
+    databases = '__all__'
+
+    def stress(self, **options):
+        """Run stress_votes, which fails if any check fails."""
+        out = io.StringIO()
+        call_command('stress_votes', stdout=out, seed=1, **options)
+        self.assertIn("All checks passed.", out.getvalue())
+        # the command deletes its poll
+        self.assertFalse(Question.objects.exists())
+        for alias in connections:
+            self.assertFalse(Vote.objects.using(alias).exists())
+        return out.getvalue()
+
+    def test_threads(self):
+        """Votes from many threads are correct."""
+        self.stress(users=100, votes=10, final_votes=5, threads=16)
+
+    def test_processes(self):
+        """Votes from several processes are correct."""
+        self.stress(users=100, votes=10, final_votes=5, threads=4, processes=4)
+
+    def test_journal(self):
+        """Votes journaled by several processes match the votes in the database."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'votes.jsonl')
+            try:
+                with override_settings(POLLS_VOTE_JOURNAL=path):
+                    out = self.stress(users=50, votes=5, final_votes=3, threads=4, processes=2)
+            finally:
+                journal._close_journal()
+                journal._journal = None
+        self.assertIn("Vote counts match the journal.", out)
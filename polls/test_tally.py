@@ -0,0 +1,107 @@
+"""Tests of the in-memory vote tally engine."""
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from .models import Choice, Question, Vote
+from .tally import QuestionTally, engine, question_results
+
+
+@override_settings(POLLS_TALLY_ENGINE=True)
+class TallyEngineTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """Create a poll with 3 choices and votes by 4 users."""
+        super().setUp()
+        engine.clear()
+        self.question = Question.objects.create(question_text="Tally me")
+        # create choices out of alphabetical order
+        self.choices = [Choice.objects.create(question=self.question, choice_text=text)
+                        for text in ("Cherry", "Apple", "Banana")]
+        self.users = [User.objects.create_user(f"user{n}", password="FatChance")
+                      for n in range(4)]
+        for user, choice in zip(self.users, [0, 0, 1, 2]):
+            Vote.objects.create(user=user, choice=self.choices[choice])
+
+    def tearDown(self):
+        engine.clear()
+        super().tearDown()
+
+    def test_question_tally(self):
+        """A user's new vote replaces the user's old vote."""
+        tally = QuestionTally([(1, "A"), (2, "B")])
+        self.assertTrue(tally.record(10, 1))
+        self.assertTrue(tally.record(11, 1))
+        self.assertTrue(tally.record(10, 2))
+        self.assertEqual(list(tally.counts), [1, 1])
+        self.assertFalse(tally.record(12, 99))
+
+    def test_tally_matches_database(self):
+        """Results from the engine are the same as counting in the database."""
+        expected = [{'id': c.id, 'choice_text': c.choice_text, 'votes': c.votes}
+                    for c in sorted(self.choices, key=lambda c: c.choice_text)]
+        self.assertEqual(question_results(self.question), expected)
+        with override_settings(POLLS_TALLY_ENGINE=False):
+            self.assertEqual(question_results(self.question), expected)
+
+    def test_load_in_chunks(self):
+        """A tally read in several chunks counts every vote once."""
+        with mock.patch('polls.tally.CHUNK_SIZE', 2):
+            tally = engine.load(self.question)
+        self.assertEqual(sorted(tally.counts), [1, 1, 2])
+        self.assertEqual(len(tally.voters), 4)
+
+    def test_read_tally_without_queries(self):
+        """After the tally is built, reading results does not query the database."""
+        question_results(self.question)
+        with self.assertNumQueries(0):
+            question_results(self.question)
+
+    def test_vote_updates_tally(self):
+        """Voting updates the tally, including when a user changes their vote."""
+        question_results(self.question)
+        self.client.login(username="user0", password="FatChance")
+        url = reverse('polls:vote', args=(self.question.id,))
+        self.client.post(url, {'choice': self.choices[2].id})
+        votes = {r['choice_text']: r['votes'] for r in question_results(self.question)}
+        self.assertEqual(votes, {"Apple": 1, "Banana": 2, "Cherry": 1})
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(response.context['results'], question_results(self.question))
+
+    def test_new_choice_rebuilds_tally(self):
+        """A vote for a choice not in the tally causes the tally to be rebuilt."""
+        question_results(self.question)
+        choice = Choice.objects.create(question=self.question, choice_text="Durian")
+        Vote.objects.create(user=self.users[3], choice=choice)
+        Vote.objects.for_question(self.question).filter(
+            user=self.users[3], choice=self.choices[2]).delete()
+        engine.record_vote(self.question.id, self.users[3].id, choice.id)
+        votes = {r['choice_text']: r['votes'] for r in question_results(self.question)}
+        self.assertEqual(votes, {"Apple": 1, "Banana": 0, "Cherry": 2, "Durian": 1})
+
+    def test_choice_change_discards_tally(self):
+        """Adding or renaming a choice discards the tally."""
+        question_results(self.question)
+        self.choices[1].choice_text = "Apricot"
+        self.choices[1].save()
+        Choice.objects.create(question=self.question, choice_text="Durian")
+        texts = [r['choice_text'] for r in question_results(self.question)]
+        self.assertEqual(texts, ["Apricot", "Banana", "Cherry", "Durian"])
+
+    def test_vote_while_loading(self):
+        """A vote recorded while a tally is built is included in the tally."""
+        load = engine.load
+
+        def load_and_vote(question):
+            tally = load(question)
+            # user3 changes their vote after the votes were read
+            Vote.objects.for_question(question).filter(
+                user=self.users[3]).update(choice=self.choices[1])
+            engine.record_vote(question.id, self.users[3].id, self.choices[1].id)
+            return tally
+
+        with mock.patch.object(engine, 'load', load_and_vote):
+            question_results(self.question)
+        votes = {r['choice_text']: r['votes'] for r in question_results(self.question)}
+        self.assertEqual(votes, {"Apple": 2, "Banana": 0, "Cherry": 2})
@@ -0,0 +1,42 @@
+"""Tests that the polls templates render without using the database."""
+import io
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .management.commands.bench_templates import render_time, template_contexts
+from .models import Choice, Question
+
+
+class TemplateRenderTest(TestCase):
+    databases = '__all__'
+
+    def test_render_without_queries(self):
+        """Templates only use values in the context, not the database."""
+        for template_name, context in template_contexts(20):
+            with self.subTest(template=template_name), self.assertNumQueries(0):
+                render_time(template_name, context, repeat=1)
+
+    def test_views_queries_do_not_grow_with_choices(self):
+        """The detail and results pages use the same queries for 2 or 20 choices."""
+        question = Question.objects.create(question_text="How many queries?")
+        for url_name in ('polls:detail', 'polls:results'):
+            url = reverse(url_name, args=(question.id,))
+            counts = []
+            for num_choices in (2, 20):
+                question.choice_set.all().delete()
+                for n in range(num_choices):
+                    Choice.objects.create(question=question, choice_text=f"Choice {n}")
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                counts.append(len(queries))
+            self.assertEqual(counts[0], counts[1], url_name)
+
+    def test_benchmark_command(self):
+        """The bench_templates command reports a time for each template."""
+        out = io.StringIO()
+        call_command('bench_templates', choices=[5], repeat=1, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[3].startswith('polls/results.html'))
@@ -51,6 +51,7 @@ def create_choices(question: Question, num_choices=2):
 
 
 class VotingTest(TestCase):
+    databases = '__all__'
 
     def setUp(self):
         """Create a test fixture before each test."""
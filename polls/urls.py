@@ -7,4 +7,5 @@ urlpatterns = [
     path('<int:question_id>/', views.detail, name='detail'),
     path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
     path('<int:question_id>/vote/', views.vote, name='vote'),
+    path('<int:pk>/export.csv', views.export_csv, name='export_csv'),
 ]
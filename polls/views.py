@@ -1,11 +1,12 @@
-from django.http import HttpResponseNotFound, HttpResponseRedirect
+from django.http import HttpResponseNotFound, HttpResponseRedirect, StreamingHttpResponse
 from django.contrib import messages
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
 from django.views import generic
 from django.contrib.auth.models import User
+from . import export, results_cache, tally
 from .models import Choice, Question, Vote
 
 
@@ -38,7 +39,8 @@ def detail(request, question_id):
     # include the user's prior vote in the context
     vote = Vote.get_vote(question=q, user=request.user)
     choice = vote.choice.id if vote and vote.choice else 0
-    context = {"question": q, "selected_choice": choice}
+    choices = q.choice_set.order_by('choice_text')
+    context = {"question": q, "choices": choices, "selected_choice": choice}
     return render(request, 'polls/detail.html', context)
 
 
@@ -46,6 +48,12 @@ class ResultsView(generic.DetailView):
     model = Question
     template_name = 'polls/results.html'
 
+    def get_context_data(self, **kwargs):
+        """Add the vote count for each choice to the context as 'results'."""
+        context = super().get_context_data(**kwargs)
+        context['results'] = tally.question_results(self.object)
+        return context
+
 
 @login_required
 def vote(request, question_id):
@@ -54,22 +62,40 @@ def vote(request, question_id):
     try:
         selected_choice = question.choice_set.get(pk=request.POST['choice'])
     except (KeyError, Choice.DoesNotExist):
-        messages.error(request, "You didn't select a valid choice.")
+        # fail_silently since mysite.settings_worker does not use messages
+        messages.error(request, "You didn't select a valid choice.",
+                       fail_silently=True)
         return redirect('polls:detail', question_id=question.id)
     # is voting allowed?
     if not question.can_vote():
         messages.error(request, 
-                 f'Voting not currently accepted for "{question.question_text}".')
+                 f'Voting not currently accepted for "{question.question_text}".',
+                 fail_silently=True)
         return redirect('polls:index')
 
     this_user = request.user
-    # update his vote or create a new vote?
-    vote = Vote.get_vote(question=question, user=this_user)
-    if vote:
-        vote.choice = selected_choice
-    else:
-        # create a new vote
-        vote = Vote(user=this_user, choice=selected_choice)
-    vote.save()
-    messages.info(request, f"Your vote for {selected_choice.choice_text} has been recorded.")
-    return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
\ No newline at end of file
+    # update the user's vote or create a new vote
+    Vote.cast(question, this_user, selected_choice)
+    tally.engine.record_vote(question.id, this_user.id, selected_choice.id)
+    results_cache.invalidate(question.id)
+    messages.info(request, f"Your vote for {selected_choice.choice_text} has been recorded.",
+                  fail_silently=True)
+    return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
+
+
+@user_passes_test(lambda user: user.is_active and user.is_staff)
+def export_csv(request, pk):
+    """Stream all votes for a poll question as a CSV file.
+
+    Add ?gzip=1 to the URL to receive a gzip compressed file.
+    """
+    question = get_object_or_404(Question, pk=pk)
+    compress = request.GET.get('gzip') in ('1', 'true', 'yes')
+    filename = f'poll-{question.id}-votes.csv'
+    if compress:
+        filename += '.gz'
+    response = StreamingHttpResponse(
+                    export.export_csv(question, compress=compress),
+                    content_type='application/gzip' if compress else 'text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response